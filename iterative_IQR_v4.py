@@ -21,8 +21,11 @@ SWAP_FLAG - "y" or "n" to swap the axes as part of the outlier identification
 
 IT_FLAG - "y" or "n" to iterate the process until no outliers are identified
 
+PLOT_FLAG - "y" or "n" to save a plot of every round
+
 -----------------
-Data is structured as a numpy structured array.
+Data is stored as parallel numpy arrays (name, xval, yval) held together in a
+SimpleNamespace, so numeric passes only touch contiguous float arrays.
 
 Plots of the data with outliers in red and linear models as dashed lines are
 saved to the working directory.
@@ -38,6 +41,7 @@ import numpy as np
 import pylab as plt
 import seaborn as sns
 import os
+from types import SimpleNamespace
 
 # Set plotting styles
 sns.set_style("ticks")
@@ -60,118 +64,106 @@ SWAP_FLAG = "n"
 # Perform iteratively? (y/n)
 IT_FLAG = "n"
 
+# Save plots of each round? (y/n)
+PLOT_FLAG = "y"
+
 ##########################################
 
 
 # Functions
 def read_file(datafile=DATAFILE):
     """This function reads the data file and returns the data
-    as a list of tuples where each row in the data file is the tuple.
+    as separate contiguous arrays for the IDs, x values, and y values.
 
     :param datafile: str, file name
-    :return: list, file contents
+    :return: SimpleNamespace, file contents (name, xval, yval arrays);
+             None if the file could not be read
     """
     try:
-        f = open(os.getcwd()+"/"+datafile)
-    except FileNotFoundError:
-        print("ERROR: Data file not found.")
+        rows = np.loadtxt(os.path.join(os.getcwd(), datafile), ndmin=1,
+                          dtype=[("name", "U10"), ("xval", float),
+                                 ("yval", float)], encoding="utf-8")
+    except OSError as error:
+        print("ERROR: Could not read data file: {}".format(error))
     else:
-        with f:
-            return [tuple(entry.split()) for entry in f]
-
-
-def calc_quartiles(sorted_diffs, cutoff):
-    """This function calculates the quartiles based on the residuals
-    (difference between observed data and model). Note that indexing has to be
-    done with int.
-
-    :param sorted_diffs: np array, residuals (float)
-    :param cutoff: float (cutoff value from Dr. Fu's method)
-    :return: float, quartile value
-    """
-
-    # Have to convert to int since using as an index
-    point_1 = int(cutoff) - 1
-    point_2 = point_1 + 1
-    distance = np.sqrt((sorted_diffs[point_2] - sorted_diffs[point_1])**2)
-
-    # Account for integer truncation, linear interpolation is used if integer
-    # is truncated
-    point_f = cutoff - int(cutoff)
-
-    if point_f == 0:
-        quartile = sorted_diffs[int(cutoff) - 1]
-    else:
-        quartile = sorted_diffs[point_1] + point_f*distance
-
-    return quartile
+        return SimpleNamespace(name=np.ascontiguousarray(rows["name"]),
+                               xval=np.ascontiguousarray(rows["xval"]),
+                               yval=np.ascontiguousarray(rows["yval"]))
 
 
 def get_outlier_index(diffs, iqr, quartile_3, quartile_1):
-    """This function determines if the value is beyond 1.5*IQR
+    """This function determines which values are beyond 1.5*IQR
 
     :param diffs: np array, residuals (float)
     :param iqr: float, IQR value
     :param quartile_3: float, 3rd quartile
     :param quartile_1: float, 1st quartile
-    :return: list, list of outlier values (float)
+    :return: np array, True where the residual is an outlier (bool)
     """
-    return [diff for diff in diffs if diff >= (quartile_3 + 1.5*iqr)
-            or diff <= (quartile_1 - 1.5*iqr)]
+    upper_limit = quartile_3 + 1.5*iqr
+    lower_limit = quartile_1 - 1.5*iqr
+    return (diffs >= upper_limit) | (diffs <= lower_limit)
 
 
-def map_outliers(outlier_list, residuals, data):
-    """This function determines the ID of the outlier values.
-
-    :param outlier_list: list, outlier values (float)
-    :param residuals: np array, residuals (float)
-    :param data: np array, the data set
-    :return: list, outlier IDs (str)
-    """
-    return [data[np.where(residuals == entry)[0][0]] for entry in outlier_list]
-
-
-def get_outliers(diffs, names, counter):
-    """This function determines the IQR cutoffs values using Dr. Fu's
-    alternative method. The cutoffs are then passed to the calc_quartiles
-    function to determine the quartiles. The quartiles are then used to
-    identify the outliers by being passed to the get_outlier_index function.
-    The outlier IDs are obtained and organized using the outlier_ids funciton.
+def get_outliers(diffs, names, counter, summary):
+    """This function determines the quartiles using Dr. Fu's alternative
+    method. Her quartile positions, (n+3)/4 and (3n+1)/4 in the sorted
+    residuals with linear interpolation between neighbors, are exactly the
+    positions used by np.quantile's default "linear" method. The quartiles
+    are then used to identify the outliers by being passed to the
+    get_outlier_index function. The outlier positions are taken from the
+    outlier mask and their IDs are written to the summary.
 
     :param diffs: np array, residuals (float)
     :param names: np array, IDs
     :param counter: int, counter keeping track of iterations
-    :return: list, outlier IDs (str)
+    :param summary: list, summary rows (str), this round's row is appended
+    :return: np array, outlier positions in the data (int)
     """
-    # sort residuals
-    sorted_diffs = np.sort(diffs)
-    # get quartile position index (float)
-    lower_cutoff = 0.25 * (len(diffs) + 3)
-    upper_cutoff = 0.25 * (3*len(diffs) + 1)
-    # calc quartiles
-    quartile_1 = calc_quartiles(sorted_diffs, lower_cutoff)
-    quartile_3 = calc_quartiles(sorted_diffs, upper_cutoff)
+    # calc quartiles (partial sort, no full np.sort needed)
+    quartile_1, quartile_3 = np.quantile(diffs, (0.25, 0.75))
     # define iqr
     iqr = quartile_3 - quartile_1
-    # get outlier index
-    outlier_list = get_outlier_index(diffs, iqr, quartile_3, quartile_1)
-    # get outlier id from index
-    outlier_ids = map_outliers(outlier_list, diffs, names)
+    # get outlier mask
+    outlier_mask = get_outlier_index(diffs, iqr, quartile_3, quartile_1)
+    # get outlier positions and ids from mask
+    outlier_index = np.flatnonzero(outlier_mask)
+    outlier_ids = names[outlier_index].tolist()
 
-    # open output file
+    # add row to summary, written to the output file at the end of the run
     outlier_str = "".join(str(outlier_ids))
-    with open(os.getcwd() + "/" + "summary.txt", "a") as f:
-        f.write('\n')
-        f.write("{:<6} {:<15} {:<15} {:<9} {:<6}"
-                .format(counter, np.round(quartile_1, 4),
-                        np.round(quartile_3, 4), np.round(iqr, 4),
-                        outlier_str))
-        f.write('\n')
+    summary.append("{:<6} {:<15} {:<15} {:<9} {:<6}"
+                   .format(counter, np.round(quartile_1, 4),
+                           np.round(quartile_3, 4), np.round(iqr, 4),
+                           outlier_str))
+
+    return outlier_index
 
-    return outlier_ids
 
+def fit_line(x_data, y_data):
+    """This function fits a straight line to the data by ordinary least
+    squares using the closed-form solution, which avoids the matrix setup of
+    np.polyfit for a two parameter model. The data are centered first so the
+    sums stay well conditioned.
 
-def perform_outlier_analysis(x_data, y_data, names, counter):
+    :param x_data: np array, x axis values (float)
+    :param y_data: np array, y axis values (float)
+    :return: float (slope), slope of the line;
+             float (intercept), intercept of the line
+    """
+    x_mean = x_data.mean()
+    y_mean = y_data.mean()
+    x_centered = x_data - x_mean
+    x_spread = x_centered @ x_centered
+    if x_spread == 0:
+        raise ValueError("Cannot fit a line: all independent values are "
+                         "equal!")
+    slope = (x_centered @ (y_data - y_mean)) / x_spread
+    intercept = y_mean - slope*x_mean
+    return slope, intercept
+
+
+def perform_outlier_analysis(x_data, y_data, names, counter, summary):
     """This function fits a linear model to the data, determines the residuals,
     and then calls the get_outliers function to identify the outliers.
 
@@ -179,150 +171,185 @@ def perform_outlier_analysis(x_data, y_data, names, counter):
     :param y_data: np array, y axis values (float)
     :param names: np array, IDs (str)
     :param counter: int, counter keeping track of iterations
-    :return: list (outliers), outlier values (float);
+    :param summary: list, summary rows (str)
+    :return: np array (outliers), outlier positions in the data (int);
              array-like (linear model), linear model
     """
-    linear_model = np.poly1d(np.polyfit(x_data, y_data, 1))
-    residuals = linear_model(x_data) - y_data
-    outliers = get_outliers(residuals, names, counter)
-    return outliers, linear_model
+    slope, intercept = fit_line(x_data, y_data)
+    # build residuals in a single buffer instead of one temporary per operator
+    residuals = slope*x_data
+    residuals += intercept
+    residuals -= y_data
+    outliers = get_outliers(residuals, names, counter, summary)
+    # poly1d wrapper is only needed by the plotting functions
+    return outliers, np.poly1d((slope, intercept))
 
 
 def remove_outliers(x_outliers, y_outliers, data):
-    """This function uses the outlier values to identify the outlier ID. This
-    is accomplished using the np.where method. If the option to swap axes
-    (outlier_flag) is set to "no", then the outliers identified from swapping
-    the axes are ignored.
-
-    Outliers are then deleted. Operations on np arrays are not done in-place,
-    so the updated dataset is assigned to the object, "data."
-
-    :param x_outliers: list, outlier values determined conventional way
-    :param y_outliers: list, outlier values determined after swapping axes
-    :param data: np array, the data
+    """This function uses the outlier positions to build a mask of the data
+    points to keep. Positions are used rather than IDs so no name matching is
+    needed. If the option to swap axes (outlier_flag) is set to "no", then
+    the outliers identified from swapping the axes are ignored.
+
+    Outliers are then deleted from each array. Operations on np arrays are
+    not done in-place, so a new dataset is returned as "data."
+
+    :param x_outliers: np array, outlier positions determined conventional way
+    :param y_outliers: np array, outlier positions determined after swapping
+                       axes
+    :param data: SimpleNamespace, the data
     :return: list (unique_outliers), outlier IDs;
-             np array (data), the data without the outliers
+             SimpleNamespace (data), the data without the outliers
     """
-    unique_outliers = list(set(x_outliers + y_outliers))
-    for entry in unique_outliers:
-        if entry in data["name"]:
-            index = np.where(data["name"] == entry)[0][0]
-            data = np.delete(data, index)
+    keep = np.ones(data.name.size, dtype=bool)
+    keep[x_outliers] = False
+    keep[y_outliers] = False
+    unique_outliers = data.name[~keep].tolist()
+    data = SimpleNamespace(name=data.name[keep], xval=data.xval[keep],
+                           yval=data.yval[keep])
     return unique_outliers, data
 
 
-def plot_one(outliers, model, data, counter):
+def make_figure(outlier_flag):
+    """This function creates the figure that is reused to plot every round.
+    Building a new figure is much slower than clearing and redrawing axes.
+    One axis is made for the conventional analysis and two when the axes are
+    swapped.
+
+    :param outlier_flag: str, "y" or "n" denoting whether or not to swap axes
+    :return: tuple, matplotlib figure and tuple of its axes
+    """
+    if outlier_flag == "y":
+        w, h = plt.figaspect(1.5)
+        fig, axes = plt.subplots(2, 1, figsize=(w, h))
+        fig.subplots_adjust(left=0.2, hspace=0.5)
+    else:
+        fig, ax = plt.subplots()
+        axes = (ax,)
+    return fig, tuple(axes)
+
+
+def reset_axes(ax):
+    """This function clears an axis from the previous round and reapplies
+    the plotting style.
+
+    :param ax: matplotlib axis
+    :return: None
+    """
+    ax.cla()
+    ax.xaxis.set_major_formatter(plt.FormatStrFormatter('%.1f'))
+    ax.yaxis.set_major_formatter(plt.FormatStrFormatter('%.1f'))
+    ax.tick_params(width=2, labelsize=14)
+    ax.set_xlabel("Independent Variables", fontsize=14)
+    ax.set_ylabel("Dependent Variables", fontsize=14)
+    sns.despine(ax=ax)
+
+
+def plot_one(outliers, model, data, counter, figure):
     """Plotting the data under the condition that axes are not swapped.
 
-    :param outliers: list, outlier IDs (str)
+    :param outliers: np array, outlier positions (int)
     :param model: array_like, linear model
-    :param data: np array, the data set
+    :param data: SimpleNamespace, the data set
     :param counter: int, counter keeping track of iterations
+    :param figure: tuple, figure and axes from make_figure
     :return: None
     """
-    fig, ax = plt.subplots()
-    ax.xaxis.set_major_formatter(plt.FormatStrFormatter('%.1f'))
-    ax.yaxis.set_major_formatter(plt.FormatStrFormatter('%.1f'))
-    smooth_x = np.linspace(min(data["xval"]), max(data["xval"]), 1000)
-    plt.plot(data["xval"], data["yval"], "ok", markersize=6)
-    plt.plot(smooth_x, model(smooth_x), "--k", linewidth=2.5)
-    for outlier in outliers:
-        index = np.where(data["name"] == outlier)[0][0]
-        plt.plot(data["xval"][index], data["yval"][index], "or", markersize=6)
-    plt.tick_params(width=2, labelsize=14)
-    plt.xlabel("Independent Variables", fontsize=14)
-    plt.ylabel("Dependent Variables", fontsize=14)
-    sns.despine()
-    plt.savefig(os.getcwd()+"/"+"no_swap_round"+str(counter)+".png")
-    plt.clf()
-
-
-def plot_all(x_outliers, y_outliers, x_model, y_model, data, counter):
+    fig, (ax,) = figure
+    reset_axes(ax)
+    # a straight line only needs its two endpoints
+    line_x = np.array([data.xval.min(), data.xval.max()])
+    ax.plot(data.xval, data.yval, "ok", markersize=6)
+    ax.plot(line_x, model(line_x), "--k", linewidth=2.5)
+    ax.plot(data.xval[outliers], data.yval[outliers], "or", markersize=6)
+    fig.savefig(os.getcwd()+"/"+"no_swap_round"+str(counter)+".png")
+
+
+def plot_all(x_outliers, y_outliers, x_model, y_model, data, counter,
+             figure):
     """Plotting the data. Outliers shown in red. Linear model shown as dotted
     line.
 
-    :param x_outliers: list, outlier IDs (str)
-    :param y_outliers: list, outlier IDs (str)
+    :param x_outliers: np array, outlier positions (int)
+    :param y_outliers: np array, outlier positions (int)
     :param x_model: array_like, linear model
     :param y_model: array_like, linear model
-    :param data: np array, the data
+    :param data: SimpleNamespace, the data
     :param counter: int, counter keeping track of iterations
+    :param figure: tuple, figure and axes from make_figure
     :return: None
     """
-    w, h = plt.figaspect(1.5)
-    fig = plt.figure(figsize=(w, h))
-    ax = fig.add_subplot(211)
-    ax.xaxis.set_major_formatter(plt.FormatStrFormatter('%.1f'))
-    ax.yaxis.set_major_formatter(plt.FormatStrFormatter('%.1f'))
-    smooth_x = np.linspace(min(data["xval"]), max(data["xval"]), 1000)
-    smooth_y = np.linspace(min(data["yval"]), max(data["yval"]), 1000)
-    plt.plot(data["xval"], data["yval"], "ok", markersize=6)
-    plt.plot(smooth_x, x_model(smooth_x), "--k", linewidth=2.5)
-    for outlier in x_outliers:
-        index = np.where(data["name"] == outlier)[0][0]
-        plt.plot(data["xval"][index], data["yval"][index], "or", markersize=6)
-    plt.tick_params(width=2, labelsize=14)
-    plt.axis([0, 1.1*max(data["xval"]), 0, 1.1*max(data["yval"])])
-    plt.xlabel("Independent Variables", fontsize=14)
-    plt.ylabel("Dependent Variables", fontsize=14)
-    ax = fig.add_subplot(212)
-    ax.xaxis.set_major_formatter(plt.FormatStrFormatter('%.1f'))
-    ax.yaxis.set_major_formatter(plt.FormatStrFormatter('%.1f'))
-    plt.plot(data["yval"], data["xval"], "ok", markersize=6)
-    plt.plot(smooth_y, y_model(smooth_y), "--k", linewidth=2.5)
-    for outlier in y_outliers:
-        index = np.where(data["name"] == outlier)[0][0]
-        plt.plot(data["yval"][index], data["xval"][index], "or", markersize=6)
-    plt.tick_params(width=2, labelsize=14)
-    plt.axis([0, 1.1*max(data["yval"]), 0, 1.1*max(data["xval"])])
-    plt.xlabel("Independent Variables", fontsize=14)
-    plt.ylabel("Dependent Variables", fontsize=14)
-    plt.subplots_adjust(left=0.2, hspace=0.5)
-    sns.despine()
-    plt.savefig(os.getcwd() + "/" + "swap_round" + str(counter) + ".png")
-
-
-def run_analysis(data, counter, outlier_flag):
+    fig, (ax_x, ax_y) = figure
+    # a straight line only needs its two endpoints
+    line_x = np.array([data.xval.min(), data.xval.max()])
+    line_y = np.array([data.yval.min(), data.yval.max()])
+    reset_axes(ax_x)
+    ax_x.plot(data.xval, data.yval, "ok", markersize=6)
+    ax_x.plot(line_x, x_model(line_x), "--k", linewidth=2.5)
+    ax_x.plot(data.xval[x_outliers], data.yval[x_outliers], "or",
+              markersize=6)
+    ax_x.axis([0, 1.1*data.xval.max(), 0, 1.1*data.yval.max()])
+    reset_axes(ax_y)
+    ax_y.plot(data.yval, data.xval, "ok", markersize=6)
+    ax_y.plot(line_y, y_model(line_y), "--k", linewidth=2.5)
+    ax_y.plot(data.yval[y_outliers], data.xval[y_outliers], "or",
+              markersize=6)
+    ax_y.axis([0, 1.1*data.yval.max(), 0, 1.1*data.xval.max()])
+    fig.savefig(os.getcwd() + "/" + "swap_round" + str(counter) + ".png")
+
+
+def run_analysis(data, counter, outlier_flag, summary, figure=None):
     """This function executes the IQR calculation by first calling
     perform_outlier_analysis which generates the linear model of the data and
     identifiers the outliers then calling remove_outliers to generate a new
     data set devoid of outliers.
 
-    :param data: np array, the data
+    :param data: SimpleNamespace, the data
     :param counter: int, counter variable keeping track of iterations
     :param outlier_flag: str, "y" or "n" denoting whether or not to swap axes
+    :param summary: list, summary rows (str)
+    :param figure: tuple, figure and axes from make_figure, None to skip plots
     :return: list (all_outliers), list of outlier IDs (str);
-             np array (data), the data without outliers;
+             SimpleNamespace (data), the data without outliers;
     """
-    x_outliers, x_model = perform_outlier_analysis(data["xval"], data["yval"],
-                                                   data["name"], counter)
+    x_outliers, x_model = perform_outlier_analysis(data.xval, data.yval,
+                                                   data.name, counter,
+                                                   summary)
     if outlier_flag == "n":
-        plot_one(x_outliers, x_model, data, counter)
+        if figure is not None:
+            plot_one(x_outliers, x_model, data, counter, figure)
         all_outliers, data = remove_outliers(x_outliers, [], data)
     elif outlier_flag == "y":
-        y_outliers, y_model = perform_outlier_analysis(data["yval"],
-                                                       data["xval"],
-                                                       data["name"], counter)
-        plot_all(x_outliers, y_outliers, x_model, y_model, data, counter)
+        y_outliers, y_model = perform_outlier_analysis(data.yval,
+                                                       data.xval,
+                                                       data.name, counter,
+                                                       summary)
+        if figure is not None:
+            plot_all(x_outliers, y_outliers, x_model, y_model, data,
+                     counter, figure)
         all_outliers, data = remove_outliers(x_outliers, y_outliers, data)
     else:
         raise ValueError("No data for outlier determination!")
     return all_outliers, data
 
 
-def iterate_analysis(all_outliers, data, outlier_flag, counter):
+def iterate_analysis(all_outliers, data, outlier_flag, counter, summary,
+                     figure=None):
     """This function executes the IQR calculation (run_analysis) recursively
     until no more outliers are identified.
 
     :param all_outliers: list, list of str values outlier IDs
-    :param data: np array, the data
+    :param data: SimpleNamespace, the data
     :param outlier_flag: str, "y" or "n", denoting whether or not to swap axes
     :param counter: int, counter variable keeping track of number of iterations
+    :param summary: list, summary rows (str)
+    :param figure: tuple, figure and axes from make_figure, None to skip plots
     :return: None
     """
     while len(all_outliers) > 0:
         counter += 1
-        all_outliers, data = run_analysis(data, counter, outlier_flag)
+        all_outliers, data = run_analysis(data, counter, outlier_flag,
+                                          summary, figure)
 
 
 def check_flags(flag):
@@ -334,17 +361,18 @@ def check_flags(flag):
     :param flag: str, ideally something similar to "yes" or "no"
     :return: str, standardized flag: "y" or "n"
     """
-    if flag in ["n", "N", "no", "No", "NO"]:
+    normalized = flag.strip().lower()
+    if normalized in ("n", "no"):
         flag = "n"
-    elif flag in ["y", "Y", "yes", "Yes", "YES", "YEs", "yES", "yeS", "yEs"]:
+    elif normalized in ("y", "yes"):
         flag = "y"
     else:
         raise ValueError("Please use an acceptable flag (for example, y or n)")
     return flag
 
 
-def run(swap_flag=SWAP_FLAG, it_flag=IT_FLAG):
-    """This function transforms the data to a numpy structured array
+def run(swap_flag=SWAP_FLAG, it_flag=IT_FLAG, plot_flag=PLOT_FLAG):
+    """This function reads the data as parallel numpy arrays
     and executes the appropriate IQR calculation based on what the user has
     set the flags to:
 
@@ -355,37 +383,50 @@ def run(swap_flag=SWAP_FLAG, it_flag=IT_FLAG):
     it_flag = "n" : Perform IQR iteratively. This means once outliers are
     identified, they are removed and the IQR calculation is repeated.
 
+    plot_flag = "n" : Skip saving plots. Only the summary file is written,
+    which is much faster for batch use.
+
     :param swap_flag: str, "y" or "n"
     :param it_flag: str, "y" or "n"
+    :param plot_flag: str, "y" or "n"
     :return: None
     """
-    # Initialize output file
-    with open(os.getcwd() + "/" + "summary.txt", "w") as f:
-        f.write("{:<6} {:<15} {:<15} {:<9} {:<6}"
-                .format("ROUND", "1st QUARTILE", "3rd QUARTILE", "IQR",
-                        "OUTLIERS"))
+    # Initialize summary with the header row
+    summary = ["{:<6} {:<15} {:<15} {:<9} {:<6}"
+               .format("ROUND", "1st QUARTILE", "3rd QUARTILE", "IQR",
+                       "OUTLIERS")]
 
     # Check flags to make sure they are compatible with "y" or "n"
     swap_flag = check_flags(swap_flag)
     it_flag = check_flags(it_flag)
+    plot_flag = check_flags(plot_flag)
 
-    # Read data from input file
+    # Read data from input file as name, xval and yval arrays
     all_data = read_file()
+    if all_data is None:
+        return
 
-    # Make structured array
-    # Note all_data.shape will be (n,) but operations are still vectorized
-    all_data = np.array(all_data, dtype=[("name", "U10"), ("xval", float),
-                                         ("yval", float)])
+    # Create the figure once, it is redrawn for every round
+    figure = make_figure(swap_flag) if plot_flag == "y" else None
 
     # Start counter to keep track of IQR iterations (start at 1)
     counter = 1
 
     # Run first IQR calculation
-    outliers, data = run_analysis(all_data, counter, swap_flag)
+    outliers, data = run_analysis(all_data, counter, swap_flag, summary,
+                                  figure)
 
     # Check if the user wants to repeat the IQR calculation iteratively
     if it_flag == 'y':
-        iterate_analysis(outliers, data, swap_flag, counter)
+        iterate_analysis(outliers, data, swap_flag, counter, summary,
+                         figure)
+
+    if figure is not None:
+        plt.close(figure[0])
+
+    # Write output file
+    with open(os.path.join(os.getcwd(), "summary.txt"), "w") as f:
+        f.write("\n".join(summary) + "\n")
 
 
 if __name__ == '__main__':